@@ -1,119 +1,281 @@
 import torch
-import torch.nn.functional as F
-from torchvision import transforms
-from PIL import Image, ExifTags
-import io
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from flask import Flask, request, jsonify
-from data_nn import TrafficSignClassifier, device
+from cpu_config import load_cpu_config, apply_cpu_config
+from inference import (
+    load_model, load_class_names, load_temperature, warm_up,
+    TOP_K, REJECT_THRESHOLD, UNKNOWN_LABEL,
+)
+from model_registry import ModelRegistry, REGISTRY_DIR
+from embedding_index import EmbeddingIndex, EMBEDDING_INDEX_PATH, load_index_model
+from pipeline import InferencePipeline, PipelineFull, create_decode_pool
 
 app = Flask(__name__)
 
-MODEL_PATH = './models/simple_cnn_traffic_sign.pth'
-NUM_CLASSES = 29 
-
-# Load class names
-with open('./dataset/valid/_classes.txt', 'r') as f:
-    class_names = [line.strip() for line in f.readlines()]
-
-# Initialize Model
-model = TrafficSignClassifier(num_classes=NUM_CLASSES)
-model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-model.to(device)
-model.eval()
-
-# Define Transform 
-test_transform = transforms.Compose([
-    transforms.Resize((30, 30)),
-    transforms.ToTensor(),
-])
-
-def fix_image_orientation(image):
-    """
-    Fix image orientation based on EXIF data.
-    Camera photos often have rotation metadata that needs to be applied.
-    """
+# Server settings, every environment override uses the TS_ prefix like cpu_config.py
+DECODE_WORKERS = int(os.environ.get('TS_DECODE_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+MAX_PENDING_DECODE = int(os.environ.get('TS_MAX_PENDING_DECODE', 64))
+MAX_QUEUED_INFERENCE = int(os.environ.get('TS_MAX_QUEUED_INFERENCE', 64))
+MAX_BATCH_SIZE = int(os.environ.get('TS_MAX_BATCH_SIZE', 32))
+REQUEST_TIMEOUT = float(os.environ.get('TS_REQUEST_TIMEOUT', 10.0))
+
+WARMUP_BATCH_SIZE = int(os.environ.get('TS_WARMUP_BATCH_SIZE', 8))
+WARMUP_ITERATIONS = int(os.environ.get('TS_WARMUP_ITERATIONS', 3))
+PREDICT_TOP_K = max(1, int(os.environ.get('TS_TOP_K', TOP_K)))
+PREDICT_REJECT_THRESHOLD = float(os.environ.get('TS_REJECT_THRESHOLD', REJECT_THRESHOLD))
+MODEL_REGISTRY_DIR = os.environ.get('TS_MODEL_REGISTRY_DIR', REGISTRY_DIR)
+MODEL_POLL_INTERVAL = float(os.environ.get('TS_MODEL_POLL_INTERVAL', 5.0))
+
+# Embedding index for nearest-neighbour lookup (embedding_index.py builds it)
+EMBEDDING_INDEX = os.environ.get('TS_EMBEDDING_INDEX', EMBEDDING_INDEX_PATH)
+KNN_K = max(1, int(os.environ.get('TS_KNN_K', 5)))
+KNN_MIN_AGREEMENT = float(os.environ.get('TS_KNN_MIN_AGREEMENT', 0.8))
+
+registry = None
+embedding_index = None
+embedding_model = None
+pipeline = None
+
+
+def embed_images(image_tensor):
+    """fc1 embeddings from the model version that built the index."""
+    with torch.no_grad():
+        return embedding_model.embed(image_tensor).cpu().numpy()
+
+
+def setup_server():
+    """Load the models and start the pipeline. Not run in spawned decode workers."""
+    global registry, embedding_index, embedding_model, pipeline
+
+    # Decode workers first, so forked processes don't inherit the pinned cores or torch threads
+    decode_pool = create_decode_pool(DECODE_WORKERS)
+
+    # Thread counts and core pinning, before the model runs anything
+    # TS_WORKER_INDEX selects the cores when several workers share a host
+    apply_cpu_config(load_cpu_config(), worker_index=int(os.environ.get('TS_WORKER_INDEX', 0)))
+
+    # Model versions are published to the registry dir (export_model.py <version>)
+    # and hot-swapped by a background watcher, routing.json splits traffic between them
+    registry = ModelRegistry(
+        MODEL_REGISTRY_DIR,
+        warmup_batch_size=WARMUP_BATCH_SIZE,
+        warmup_iterations=WARMUP_ITERATIONS,
+        poll_interval=MODEL_POLL_INTERVAL,
+    )
+    registry.refresh()
+
+    if not registry.is_ready():
+        # Empty registry: serve the default model (frozen artifact if exported, state dict otherwise)
+        model, model_meta = load_model()
+        # the frozen artifact carries its own class names
+        class_names = model_meta.get('class_names') or load_class_names()
+        # Softmax temperature fitted on dataset/valid by calibrate.py
+        temperature = load_temperature()
+        warm_up(model, batch_size=WARMUP_BATCH_SIZE, iterations=WARMUP_ITERATIONS)
+        registry.register('default', model, class_names, temperature)
+
+    registry.start()
+
+    embedding_index = EmbeddingIndex.load(EMBEDDING_INDEX) if os.path.exists(EMBEDDING_INDEX) else None
+
+    # The index only matches the model version that built it. Keep our own reference to that
+    # model, routing can drop the version (e.g. 'default' once versions are published)
+    if embedding_index is not None:
+        index_version = registry.get(embedding_index.model_version)
+        try:
+            if index_version is not None:
+                embedding_model = index_version.model
+            else:
+                embedding_model, _ = load_index_model(embedding_index.model_version, MODEL_REGISTRY_DIR)
+                warm_up(embedding_model, batch_size=WARMUP_BATCH_SIZE, iterations=WARMUP_ITERATIONS)
+            if not hasattr(embedding_model, 'embed'):
+                # frozen artifacts exported before embed() was preserved
+                raise AttributeError('model has no embed method, re-export it')
+        except Exception as e:
+            embedding_model = None
+            print(f"Error. Could not load model version '{embedding_index.model_version}' of the embedding index, "
+                  f"/neighbors and /exemplars are disabled and /predict has no k-NN check: {e}")
+            print("Rebuild the index with: python embedding_index.py --model-version <served version>")
+
+    # decode process pool -> bounded queue -> inference thread, which owns the models
+    pipeline = InferencePipeline(
+        registry,
+        decode_pool,
+        DECODE_WORKERS,
+        max_pending_decode=MAX_PENDING_DECODE,
+        max_queued=MAX_QUEUED_INFERENCE,
+        max_batch_size=MAX_BATCH_SIZE,
+        predict_args={'top_k': PREDICT_TOP_K, 'reject_threshold': PREDICT_REJECT_THRESHOLD},
+        embed=embed_images if embedding_model is not None else None,
+    )
+
+
+# Without fork the decode workers are spawned and re-import this file as __mp_main__,
+# they must not load the models or start another pool
+if __name__ != '__mp_main__':
+    setup_server()
+
+
+def run_pipeline(file, embedding_only=False):
+    """Returns (pipeline output, None) or (None, error response)."""
+    # Read image file from memory (don't need to save to disk), decode happens in the pool
+    image_bytes = file.read()
     try:
-        # Get EXIF data
-        exif = image._getexif()
-        if exif is None:
-            return image
-        
-        # Find the orientation tag
-        orientation_key = None
-        for key, value in ExifTags.TAGS.items():
-            if value == 'Orientation':
-                orientation_key = key
-                break
-        
-        if orientation_key is None or orientation_key not in exif:
-            return image
-        
-        orientation = exif[orientation_key]
-        
-        # Apply rotation based on orientation value
-        if orientation == 2:
-            image = image.transpose(Image.FLIP_LEFT_RIGHT)
-        elif orientation == 3:
-            image = image.rotate(180, expand=True)
-        elif orientation == 4:
-            image = image.transpose(Image.FLIP_TOP_BOTTOM)
-        elif orientation == 5:
-            image = image.transpose(Image.FLIP_LEFT_RIGHT).rotate(270, expand=True)
-        elif orientation == 6:
-            image = image.rotate(270, expand=True)
-        elif orientation == 7:
-            image = image.transpose(Image.FLIP_LEFT_RIGHT).rotate(90, expand=True)
-        elif orientation == 8:
-            image = image.rotate(90, expand=True)
-            
-    except (AttributeError, KeyError, IndexError, TypeError):
-        # If anything goes wrong, just return the original image
-        pass
-    
-    return image
+        return pipeline.submit(image_bytes, embedding_only=embedding_only).result(timeout=REQUEST_TIMEOUT), None
+    except PipelineFull as e:
+        return None, (jsonify({'error': f'Server busy: {e}'}), 429)
+    except FutureTimeoutError:
+        return None, (jsonify({'error': 'Prediction timed out'}), 504)
 
 
-@app.route('/predict', methods=['POST'])
-def predict():
+def get_upload():
     if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+        return None, (jsonify({'error': 'No file part'}), 400)
     
     file = request.files['file']
     
     if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+        return None, (jsonify({'error': 'No selected file'}), 400)
+    return file, None
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = {
+        'ready': registry.is_ready(),
+        # the server still serves /predict without the index, this shows why k-NN is missing
+        'embedding_index': {
+            'model_version': embedding_index.model_version,
+            'available': embedding_model is not None,
+        } if embedding_index is not None else None,
+    }
+    if not status['ready']:
+        return jsonify(status), 503
+    return jsonify(status)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(registry.metrics())
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    file, error = get_upload()
+    if error:
+        return error
 
     try:
-        # Read image file from memory (don't need to save to disk)
-        image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Fix orientation for camera photos (EXIF rotation)
-        image = fix_image_orientation(image)
-        
-        # Convert to RGB after fixing orientation
-        image = image.convert('RGB')
-        
-        # Transform image
-        image_tensor = test_transform(image).unsqueeze(0).to(device)
-
-        # Predict
-        with torch.no_grad():
-            outputs = model(image_tensor)
-            probs = F.softmax(outputs, dim=1)
-            predicted_class = torch.argmax(probs, dim=1).item()
-            predicted_label = class_names[predicted_class]
-            confidence = probs[0][predicted_class].item()
+        # Predict (calibrated top-k + rejection), batched with other requests on the inference thread
+        output, error = run_pipeline(file)
+        if error:
+            return error
+
+        version = output['version']
+        class_names = version.class_names
+        result = output['prediction']
+
+        predicted_class = result['class_id']
+        predicted_label = UNKNOWN_LABEL if result['rejected'] else class_names[predicted_class]
 
         # Return result as JSON
-        return jsonify({
+        # rejected=True means low confidence, the client can route the frame to a fallback
+        response = {
             'class_id': predicted_class,
             'label': predicted_label,
-            'confidence': f"{confidence:.2f}"
+            'confidence': f"{result['confidence']:.2f}",
+            'rejected': result['rejected'],
+            'model_version': version.name,
+            'knn_override': False,
+            'top_k': [
+                {'class_id': class_id, 'label': class_names[class_id], 'confidence': round(prob, 4)}
+                for class_id, prob in result['top_k']
+            ],
+        }
+
+        # k-NN sanity check against the embedding index
+        embedding = output['embedding']
+        if embedding is not None:
+            knn_label, agreement = embedding_index.knn_label(embedding_index.search(embedding, KNN_K)[0])
+            response['knn'] = {'label': knn_label, 'agreement': round(agreement, 4)}
+
+            # open-set: the classifier is unsure but the exemplars agree (e.g. a class added via /exemplars)
+            # rejected and top_k stay the classifier's, knn_override tells the client the label is not
+            if result['rejected'] and agreement >= KNN_MIN_AGREEMENT:
+                response['label'] = knn_label
+                # -1 for classes only known from exemplars, the mobile app parses class_id as int
+                response['class_id'] = class_names.index(knn_label) if knn_label in class_names else -1
+                response['knn_override'] = True
+
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/neighbors', methods=['POST'])
+def neighbors():
+    file, error = get_upload()
+    if error:
+        return error
+
+    try:
+        k = int(request.form.get('k', KNN_K))
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
+    if k < 1:
+        return jsonify({'error': 'k must be at least 1'}), 400
+
+    try:
+        output, error = run_pipeline(file, embedding_only=True)
+        if error:
+            return error
+
+        embedding = output['embedding']
+        if embedding is None:
+            return jsonify({'error': 'Embedding index not available'}), 503
+
+        return jsonify({
+            'model_version': embedding_index.model_version,
+            'neighbors': [
+                {'id': item_id, 'label': label, 'similarity': round(score, 4)}
+                for item_id, label, score in embedding_index.search(embedding, k)[0]
+            ],
         })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@app.route('/exemplars', methods=['POST'])
+def add_exemplar():
+    """Add a labelled image to the index, a new label adds a new sign class without retraining."""
+    file, error = get_upload()
+    if error:
+        return error
+
+    label = request.form.get('label', '').strip()
+    if not label:
+        return jsonify({'error': 'No label'}), 400
+
+    try:
+        output, error = run_pipeline(file, embedding_only=True)
+        if error:
+            return error
+
+        embedding = output['embedding']
+        if embedding is None:
+            return jsonify({'error': 'Embedding index not available'}), 503
+
+        embedding_index.add(embedding, [label])
+        if request.form.get('save', '0') in ('1', 'true'):
+            embedding_index.save(EMBEDDING_INDEX)
+        return jsonify({'label': label, 'size': len(embedding_index)})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
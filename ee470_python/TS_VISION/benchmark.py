@@ -0,0 +1,154 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import torch
+from cpu_config import CPU_CONFIG_PATH, available_cpus, load_cpu_config, apply_cpu_config
+from inference import device, load_model, warm_up, INPUT_SIZE
+
+
+def benchmark(model, batch_size=1, iterations=200, warmup_iterations=10):
+    """Measure per-batch latency of the model, returns latency percentiles (ms) and throughput."""
+    warm_up(model, batch_size=batch_size, iterations=warmup_iterations)
+
+    inputs = torch.rand(batch_size, 3, INPUT_SIZE, INPUT_SIZE, device=device)
+    latencies = []
+    with torch.no_grad():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            model(inputs)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'batch_size': batch_size,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'images_per_sec': batch_size * iterations / elapsed,
+    }
+
+
+def run_worker(config, worker_index, batch_size, iterations):
+    apply_cpu_config(config, worker_index=worker_index)
+    model, _ = load_model()
+    return benchmark(model, batch_size=batch_size, iterations=iterations)
+
+
+def run_config(config, batch_size, iterations):
+    """
+    Run config['workers'] benchmark processes at the same time, like server workers on one host.
+    Each candidate runs in fresh processes because torch thread settings can only be set once.
+    """
+    procs = []
+    for worker_index in range(config['workers']):
+        cmd = [sys.executable, os.path.abspath(__file__),
+               '--worker-config', json.dumps(config),
+               '--worker-index', str(worker_index),
+               '--batch-size', str(batch_size),
+               '--iterations', str(iterations)]
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True))
+
+    # wait for every worker even if one fails, leftovers would skew the next candidate
+    outputs = [proc.communicate()[0] for proc in procs]
+    if any(proc.returncode != 0 for proc in procs):
+        return None
+
+    # the result is the last line, anything before it is log output
+    results = [json.loads(stdout.strip().splitlines()[-1]) for stdout in outputs]
+
+    return {
+        'images_per_sec': sum(r['images_per_sec'] for r in results),
+        'p99_ms': max(r['p99_ms'] for r in results),
+    }
+
+
+def is_better(result, best_result, p99_tolerance=1.1):
+    """
+    Lower p99 latency wins, throughput breaks ties between candidates
+    whose p99 is within p99_tolerance of each other.
+    """
+    if best_result is None:
+        return True
+    if result['p99_ms'] * p99_tolerance < best_result['p99_ms']:
+        return True
+    if best_result['p99_ms'] * p99_tolerance < result['p99_ms']:
+        return False
+    return result['images_per_sec'] > best_result['images_per_sec']
+
+
+def tune(batch_size=1, iterations=200, output_path=CPU_CONFIG_PATH, max_p99_ms=None):
+    """
+    Sweep workers x threads x pinning x interop threads and write the best configuration.
+    Candidates above max_p99_ms are skipped, the rest are ranked by p99 then throughput.
+    """
+    num_cpus = len(available_cpus())
+    worker_counts = sorted({1, 2, 4, num_cpus // 2, num_cpus} - {0})
+    thread_counts = sorted({1, 2, 4, num_cpus} - {0})
+
+    best_config, best_result = None, None
+    for workers, threads, pin_cores, interop_threads in itertools.product(worker_counts, thread_counts, (False, True), (1, 2)):
+        if workers * threads > num_cpus:
+            continue  # oversubscribed
+
+        config = {
+            'num_threads': threads,
+            'interop_threads': interop_threads,
+            'pin_cores': pin_cores,
+            'workers': workers,
+        }
+        result = run_config(config, batch_size, iterations)
+        if result is None:
+            print(f"Failed: {config}")
+            continue
+        print(f"{config} -> {result['images_per_sec']:.1f} img/s, p99 {result['p99_ms']:.2f} ms")
+
+        if max_p99_ms is not None and result['p99_ms'] > max_p99_ms:
+            continue
+        if is_better(result, best_result):
+            best_config, best_result = config, result
+
+    if best_config is None:
+        print("Error. No configuration could be benchmarked.")
+        return None
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(best_config, f, indent=2)
+
+    print(f"\nBest: {best_config} -> {best_result['images_per_sec']:.1f} img/s, p99 {best_result['p99_ms']:.2f} ms")
+    print(f"CPU config saved to: {output_path}")
+    return best_config
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Benchmark CPU inference and tune thread settings.')
+    parser.add_argument('--tune', action='store_true', help='sweep thread/pinning settings and save the best one')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--max-p99-ms', type=float, default=None, help='with --tune, skip configurations above this p99 latency')
+    parser.add_argument('--worker-config', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-index', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_config:
+        result = run_worker(json.loads(args.worker_config), args.worker_index, args.batch_size, args.iterations)
+        print(json.dumps(result))
+    elif args.tune:
+        tune(batch_size=args.batch_size, iterations=args.iterations, max_p99_ms=args.max_p99_ms)
+    else:
+        config = load_cpu_config()
+        result = run_worker(config, int(os.environ.get('TS_WORKER_INDEX', 0)), args.batch_size, args.iterations)
+        print(f"Batch size: {result['batch_size']}")
+        print(f"Latency p50/p95/p99: {result['p50_ms']:.2f} / {result['p95_ms']:.2f} / {result['p99_ms']:.2f} ms")
+        print(f"Throughput: {result['images_per_sec']:.1f} images/sec")
@@ -0,0 +1,89 @@
+import json
+import os
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from inference import device, load_model, test_transform, CALIBRATION_PATH
+from train_model import AnnotationDataset, annotation_file_for
+
+
+def collect_logits(model, dataloader):
+    all_logits, all_labels = [], []
+    with torch.no_grad():
+        for inputs, labels in dataloader:
+            all_logits.append(model(inputs.to(device)).cpu())
+            all_labels.append(labels)
+    return torch.cat(all_logits), torch.cat(all_labels)
+
+
+def expected_calibration_error(logits, labels, temperature, num_bins=15):
+    probs = F.softmax(logits / temperature, dim=1)
+    confidences, predictions = probs.max(dim=1)
+    correct = (predictions == labels).float()
+
+    ece = torch.zeros(1)
+    bin_edges = torch.linspace(0, 1, num_bins + 1)
+    for low, high in zip(bin_edges[:-1], bin_edges[1:]):
+        in_bin = (confidences > low) & (confidences <= high)
+        if in_bin.any():
+            ece += in_bin.float().mean() * torch.abs(confidences[in_bin].mean() - correct[in_bin].mean())
+    return ece.item()
+
+
+def fit_temperature(logits, labels, max_iter=50):
+    """Fit a single softmax temperature by minimizing validation NLL (temperature scaling)."""
+    # optimize log(T) so the temperature stays positive
+    log_temperature = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_temperature], lr=0.1, max_iter=max_iter)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_temperature.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return log_temperature.exp().item()
+
+
+def calibrate(data_dir='./dataset/valid', output_path=CALIBRATION_PATH, batch_size=256):
+    model, _ = load_model()
+
+    valid_dataset = AnnotationDataset(
+        annotation_file=annotation_file_for(data_dir),
+        img_dir=data_dir,
+        transform=test_transform
+    )
+    valid_dataloader = DataLoader(valid_dataset, batch_size=batch_size, shuffle=False)
+
+    print(f"Collecting logits on {len(valid_dataset)} validation images...")
+    logits, labels = collect_logits(model, valid_dataloader)
+
+    temperature = fit_temperature(logits, labels)
+
+    nll_before = F.cross_entropy(logits, labels).item()
+    nll_after = F.cross_entropy(logits / temperature, labels).item()
+    ece_before = expected_calibration_error(logits, labels, 1.0)
+    ece_after = expected_calibration_error(logits, labels, temperature)
+
+    print(f"Temperature: {temperature:.4f}")
+    print(f"NLL: {nll_before:.4f} -> {nll_after:.4f}")
+    print(f"ECE: {ece_before:.4f} -> {ece_after:.4f}")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump({
+            'temperature': temperature,
+            'nll_before': nll_before,
+            'nll_after': nll_after,
+            'ece_before': ece_before,
+            'ece_after': ece_after,
+        }, f, indent=2)
+    print(f"\nCalibration saved to: {output_path}")
+
+    return temperature
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    calibrate()
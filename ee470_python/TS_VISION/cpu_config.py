@@ -0,0 +1,118 @@
+import glob
+import json
+import os
+import torch
+
+CPU_CONFIG_PATH = './models/cpu_config.json'
+
+DEFAULT_CPU_CONFIG = {
+    'num_threads': 0,        # 0 -> available cores / workers
+    'interop_threads': 0,    # 0 -> leave torch default
+    'pin_cores': False,
+    'workers': 1,
+}
+
+
+def parse_cpu_list(cpu_list):
+    """Parse a kernel cpu list like '0-3,8-11' into [0, 1, 2, 3, 8, 9, 10, 11]."""
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """Return the usable cpus of each NUMA node, one list per node."""
+    allowed = set(available_cpus())
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')):
+        with open(path, 'r') as f:
+            cpus = [cpu for cpu in parse_cpu_list(f.read()) if cpu in allowed]
+        if cpus:
+            nodes.append(cpus)
+
+    # no NUMA info (non-Linux, containers) -> one node with every cpu
+    if not nodes:
+        nodes = [sorted(allowed)]
+    return nodes
+
+
+def worker_cores(worker_index, threads_per_worker):
+    """
+    Pick the cores for one worker. Each worker stays inside a single NUMA node
+    and workers are spread round-robin over the nodes.
+    """
+    slots_per_node = []
+    for cpus in numa_nodes():
+        slots = [cpus[i:i + threads_per_worker] for i in range(0, len(cpus) - threads_per_worker + 1, threads_per_worker)]
+        slots_per_node.append(slots or [cpus])
+
+    # interleave node0 slot0, node1 slot0, node0 slot1, ...
+    slots = []
+    for i in range(max(len(s) for s in slots_per_node)):
+        for node_slots in slots_per_node:
+            if i < len(node_slots):
+                slots.append(node_slots[i])
+
+    return slots[worker_index % len(slots)]
+
+
+def load_cpu_config(config_path=CPU_CONFIG_PATH):
+    """Defaults, then the tuned config file if present, then TS_* environment overrides."""
+    config = dict(DEFAULT_CPU_CONFIG)
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config.update(json.load(f))
+
+    if 'TS_NUM_THREADS' in os.environ:
+        config['num_threads'] = int(os.environ['TS_NUM_THREADS'])
+    if 'TS_INTEROP_THREADS' in os.environ:
+        config['interop_threads'] = int(os.environ['TS_INTEROP_THREADS'])
+    if 'TS_PIN_CORES' in os.environ:
+        config['pin_cores'] = os.environ['TS_PIN_CORES'] not in ('0', 'false', 'False', '')
+    if 'TS_WORKERS' in os.environ:
+        config['workers'] = int(os.environ['TS_WORKERS'])
+    return config
+
+
+def apply_cpu_config(config, worker_index=0):
+    """
+    Apply thread counts and core pinning to the current process.
+    Must run before the first forward pass, torch only accepts
+    the interop thread count once.
+    """
+    num_threads = config.get('num_threads', 0)
+    if num_threads <= 0:
+        # split the cores between the workers instead of every worker taking all of them
+        num_threads = max(1, len(available_cpus()) // max(1, config.get('workers', 1)))
+
+    cores = None
+    if config.get('pin_cores') and hasattr(os, 'sched_setaffinity'):
+        cores = worker_cores(worker_index, num_threads)
+        os.sched_setaffinity(0, cores)
+        num_threads = min(num_threads, len(cores))
+
+    torch.set_num_threads(num_threads)
+
+    interop_threads = config.get('interop_threads', 0)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Warning: could not set interop threads: {e}")
+
+    print(f"CPU config: worker={worker_index}, threads={num_threads}, "
+          f"interop={torch.get_num_interop_threads()}, cores={cores if cores else 'unpinned'}")
+    return cores
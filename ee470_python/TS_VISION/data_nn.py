@@ -30,7 +30,7 @@ class TrafficSignClassifier(nn.Module):
         self.fc1 = nn.Linear(64 * 5 * 5, 128) #predict value, change something, 64 çıktım var 5x5'te ilkb boyutum, 128 orta boy veriler için iyi bir tespittir
         self.fc2 = nn.Linear(128, num_classes) # output layer
   
-    def forward(self, x):
+    def embed(self, x):
         # -> conv 1 -> ReLU -> MaxPool
         x = self.pool(F.relu(self.conv1(x)))
         
@@ -40,10 +40,15 @@ class TrafficSignClassifier(nn.Module):
         #Flatten  layer
         x = torch.flatten(x, 1) #1D dim
         
-        # -> Dropout -> Linear 1 -> ReLU
+        # -> Dropout -> Linear 1 -> ReLU, 128-dim embedding
         x = self.dropout(x)
         x = F.relu(self.fc1(x))
         
+        return x
+
+    def forward(self, x):
+        x = self.embed(x)
+        
         # -> Linear 2 layer
         x = self.fc2(x)
         
@@ -51,6 +56,7 @@ class TrafficSignClassifier(nn.Module):
 
 #start model
 NUM_CLASSES = 29 #check train--> classes
+LEARNING_RATE = 0.001
 
 model = TrafficSignClassifier(NUM_CLASSES).to(device)
 
@@ -58,18 +64,28 @@ model = TrafficSignClassifier(NUM_CLASSES).to(device)
 criterion = nn.CrossEntropyLoss() 
 
 # Optimizastion
-optimizer = optim.Adam(model.parameters(), lr=0.001)
+optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
 
 
 # train
-def train_model(model, dataloader, criterion, optimizer, num_epochs=10):
+def train_model(model, dataloader, criterion, optimizer, num_epochs=10, sampler=None, target_accuracy=None, on_epoch_end=None,
+                valid_dataloader=None):
+    # target accuracy is measured on held-out data, train accuracy on a resampled stream says little
+    if target_accuracy is not None and valid_dataloader is None:
+        raise ValueError("target_accuracy needs a valid_dataloader")
+
+    images_seen = 0
     for epoch in range(num_epochs):  
         running_loss = 0.0
         correct=0
         total=0
         for i, data in enumerate(dataloader, 0):
-            # find labels
-            inputs, labels = data
+            # find labels, IndexedDataset also gives the sample indices
+            if len(data) == 3:
+                inputs, labels, indices = data
+            else:
+                inputs, labels = data
+                indices = None
             inputs, labels = inputs.to(device), labels.to(device)
 
             #set zero for gradyan
@@ -78,8 +94,13 @@ def train_model(model, dataloader, criterion, optimizer, num_epochs=10):
             # Forward Pass
             outputs = model(inputs)
             
-            #Calculate loss
-            loss = criterion(outputs, labels)
+            #Calculate loss, per sample when the sampler tracks hard examples
+            if sampler is not None and indices is not None and hasattr(sampler, 'update'):
+                sample_losses = F.cross_entropy(outputs, labels, reduction='none')
+                loss = sample_losses.mean()
+                sampler.update(indices, sample_losses.detach())
+            else:
+                loss = criterion(outputs, labels)
             
             # Backward Pass- optimizasyon
             loss.backward()
@@ -94,9 +115,37 @@ def train_model(model, dataloader, criterion, optimizer, num_epochs=10):
             correct += (predicted == labels).sum().item() 
             
 
+        images_seen += total
         accuracy = 100 * correct / total
-        print(f'Epoch {epoch + 1}, Loss: {running_loss / len(dataloader):.4f}, Accuracy: %{accuracy:.2f}')
+        print(f'Epoch {epoch + 1}, Loss: {running_loss / len(dataloader):.4f}, Accuracy: %{accuracy:.2f}, Images: {images_seen}')
+
+        # stop early once the validation target is reached
+        if target_accuracy is not None:
+            valid_accuracy = evaluate_model(model, valid_dataloader)
+            print(f'Validation Accuracy: %{valid_accuracy:.2f}')
+            if valid_accuracy >= target_accuracy:
+                print(f'Target accuracy %{target_accuracy:.2f} reached after {epoch + 1} epochs.')
+                break
+
+        # callback returns True to stop (e.g. a pruned sweep trial)
+        if on_epoch_end is not None and on_epoch_end(epoch, running_loss / len(dataloader), accuracy):
+            print(f'Stopped after {epoch + 1} epochs.')
+            break
 
     print('Train is succeSsfully.')
 
 
+# evaluate
+def evaluate_model(model, dataloader):
+    model.eval()
+    correct = 0
+    total = 0
+    with torch.no_grad():
+        for data in dataloader:
+            inputs, labels = data[0].to(device), data[1].to(device)
+            outputs = model(inputs)
+            _, predicted = torch.max(outputs, 1)
+            total += labels.size(0)
+            correct += (predicted == labels).sum().item()
+    model.train()
+    return 100 * correct / total
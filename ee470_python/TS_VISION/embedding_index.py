@@ -0,0 +1,266 @@
+import argparse
+import os
+import threading
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from inference import device, load_model, load_class_names, test_transform
+from model_registry import REGISTRY_DIR, load_version
+
+EMBEDDING_INDEX_PATH = './models/embedding_index.npz'
+EMBEDDING_DIM = 128
+
+
+def extract_embeddings(model, dataloader):
+    """fc1 activations of every image as one (N, 128) float32 array, plus the labels."""
+    embeddings, labels = [], []
+    with torch.no_grad():
+        for inputs, batch_labels in dataloader:
+            embeddings.append(model.embed(inputs.to(device)).cpu())
+            labels.append(batch_labels)
+    return torch.cat(embeddings).numpy().astype(np.float32), torch.cat(labels).numpy()
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def quantize(vectors):
+    """Symmetric int8 quantization with one scale per vector (4x smaller than float32)."""
+    scales = np.maximum(np.abs(vectors).max(axis=1, keepdims=True), 1e-12) / 127.0
+    return np.round(vectors / scales).astype(np.int8), scales.astype(np.float32)
+
+
+def kmeans(vectors, num_clusters, iterations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(num_clusters):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+class BruteForceIndex:
+    """Exact cosine nearest neighbours, one matrix multiply per query batch."""
+
+    backend = 'bruteforce'
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, vectors):
+        self.vectors = np.concatenate([self.vectors, normalize(vectors)])
+
+    def search(self, queries, k):
+        """Returns (scores, ids), both (num_queries, k)."""
+        scores = normalize(queries) @ self.vectors.T
+        ids = top_k(scores, k)
+        return np.take_along_axis(scores, ids, axis=1), ids
+
+    def state(self):
+        return {'vectors': self.vectors}
+
+    def load_state(self, state):
+        self.vectors = state['vectors']
+
+
+class IVFIndex:
+    """
+    Inverted file index: vectors are bucketed by their nearest k-means centroid
+    and stored as int8. A query only scans the nprobe closest buckets.
+    """
+
+    backend = 'ivf'
+
+    def __init__(self, dim=EMBEDDING_DIM, num_lists=32, nprobe=4):
+        self.num_lists = num_lists
+        self.nprobe = nprobe
+        self.centroids = None
+        self.codes = np.empty((0, dim), dtype=np.int8)
+        self.scales = np.empty((0, 1), dtype=np.float32)
+        self.assignment = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def train(self, vectors):
+        vectors = normalize(vectors)
+        self.centroids = kmeans(vectors, min(self.num_lists, len(vectors)))
+
+    def add(self, vectors):
+        vectors = normalize(vectors)
+        if self.centroids is None:
+            self.train(vectors)
+        codes, scales = quantize(vectors)
+        self.codes = np.concatenate([self.codes, codes])
+        self.scales = np.concatenate([self.scales, scales])
+        self.assignment = np.concatenate([self.assignment, np.argmax(vectors @ self.centroids.T, axis=1)])
+
+    def search(self, queries, k):
+        queries = normalize(queries)
+        probes = top_k(queries @ self.centroids.T, self.nprobe)
+
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.nonzero(np.isin(self.assignment, probes[i]))[0]
+            if not len(candidates):
+                continue
+            scores = (self.codes[candidates] @ query) * self.scales[candidates, 0]
+            best = top_k(scores[None, :], k)[0]
+            all_scores[i, :len(best)] = scores[best]
+            all_ids[i, :len(best)] = candidates[best]
+        return all_scores, all_ids
+
+    def state(self):
+        return {
+            'centroids': self.centroids,
+            'codes': self.codes,
+            'scales': self.scales,
+            'assignment': self.assignment,
+            'nprobe': np.array(self.nprobe),
+        }
+
+    def load_state(self, state):
+        self.centroids = state['centroids']
+        self.codes = state['codes']
+        self.scales = state['scales']
+        self.assignment = state['assignment']
+        self.nprobe = int(state['nprobe'])
+        self.num_lists = len(self.centroids)
+
+
+class EmbeddingIndex:
+    """
+    Labelled embedding index. Labels are class names, so new sign classes
+    can be added from exemplars without retraining the classifier.
+    """
+
+    def __init__(self, backend='bruteforce', model_version='default', **backend_args):
+        self.index = IVFIndex(**backend_args) if backend == 'ivf' else BruteForceIndex(**backend_args)
+        self.model_version = model_version
+        self.label_names = []
+        self.labels = np.empty(0, dtype=np.int64)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def label_id(self, label_name):
+        if label_name not in self.label_names:
+            self.label_names.append(label_name)
+        return self.label_names.index(label_name)
+
+    def add(self, vectors, label_names):
+        with self.lock:
+            label_ids = [self.label_id(name) for name in label_names]
+            self.index.add(vectors)
+            self.labels = np.concatenate([self.labels, np.asarray(label_ids, dtype=np.int64)])
+
+    def search(self, queries, k=5):
+        """Per query a list of (item id, label name, cosine similarity), best first."""
+        with self.lock:
+            if not len(self.index):
+                return [[] for _ in queries]
+            scores, ids = self.index.search(queries, k)
+            return [
+                [(int(item_id), self.label_names[self.labels[item_id]], float(score))
+                 for item_id, score in zip(row_ids, row_scores) if item_id >= 0]
+                for row_ids, row_scores in zip(ids, scores)
+            ]
+
+    def knn_label(self, neighbours):
+        """Majority label of the neighbours and the fraction that agree with it."""
+        if not neighbours:
+            return None, 0.0
+        names = [name for _, name, _ in neighbours]
+        best = max(set(names), key=names.count)
+        return best, names.count(best) / len(names)
+
+    def save(self, path=EMBEDDING_INDEX_PATH):
+        with self.lock:
+            np.savez(path, backend=np.array(self.index.backend), model_version=np.array(self.model_version),
+                     label_names=np.array(self.label_names), labels=self.labels, **self.index.state())
+
+    @classmethod
+    def load(cls, path=EMBEDDING_INDEX_PATH):
+        state = np.load(path)
+        index = cls(backend=str(state['backend']), model_version=str(state['model_version']))
+        index.index.load_state(state)
+        index.label_names = [str(name) for name in state['label_names']]
+        index.labels = state['labels']
+        return index
+
+
+def load_index_model(model_version='default', registry_dir=REGISTRY_DIR):
+    """
+    The model an index is built with and queried through, plus its class names:
+    the default artifact or a registry version.
+    """
+    if model_version == 'default':
+        model, meta = load_model()
+        return model, meta.get('class_names') or load_class_names()
+    model, class_names, _ = load_version(os.path.join(registry_dir, model_version))
+    return model, class_names
+
+
+def build_index(data_dir='./dataset/train', output_path=EMBEDDING_INDEX_PATH, backend='bruteforce',
+                model_version='default', batch_size=256):
+    # imported here, train_model pulls in the training model and optimizer from data_nn
+    from train_model import AnnotationDataset, annotation_file_for
+
+    # embeddings only compare within one model, so the index records which version built it
+    model, class_names = load_index_model(model_version)
+
+    dataset = AnnotationDataset(
+        annotation_file=annotation_file_for(data_dir),
+        img_dir=data_dir,
+        transform=test_transform
+    )
+    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+    print(f"Extracting embeddings of {len(dataset)} images...")
+    embeddings, labels = extract_embeddings(model, dataloader)
+
+    index = EmbeddingIndex(backend=backend, model_version=model_version)
+    index.add(embeddings, [class_names[label] for label in labels])
+
+    # k-NN sanity check: leave-one-out accuracy of the nearest other exemplar
+    neighbours = index.search(embeddings[:1000], k=2)
+    agree = sum(1 for label, row in zip(labels[:1000], neighbours) if len(row) > 1 and row[1][1] == class_names[label])
+    print(f"Nearest-neighbour label agreement (first {min(1000, len(labels))}): %{100 * agree / max(1, min(1000, len(labels))):.2f}")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    index.save(output_path)
+    print(f"Embedding index ({backend}, {len(index)} vectors) saved to: {output_path}")
+    return index
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Build the embedding index over the training set.')
+    parser.add_argument('--backend', choices=['bruteforce', 'ivf'], default='bruteforce')
+    parser.add_argument('--data-dir', default='./dataset/train')
+    parser.add_argument('--output', default=EMBEDDING_INDEX_PATH)
+    parser.add_argument('--model-version', default='default', help='registry version to embed with')
+    args = parser.parse_args()
+
+    build_index(args.data_dir, args.output, args.backend, args.model_version)
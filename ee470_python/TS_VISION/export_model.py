@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import sys
+import torch
+from inference import (
+    MODEL_PATH, FROZEN_MODEL_PATH, CLASSES_PATH, CALIBRATION_PATH, NUM_CLASSES, INPUT_SIZE,
+    device, load_class_names, load_eager_model, load_frozen_model,
+)
+from model_registry import REGISTRY_DIR, load_version, VERSION_FROZEN_MODEL, VERSION_STATE_DICT, VERSION_CLASSES, VERSION_CALIBRATION
+
+
+def export_frozen_model(state_dict_path=MODEL_PATH, output_path=FROZEN_MODEL_PATH,
+                        classes_path=CLASSES_PATH, num_classes=NUM_CLASSES, tolerance=1e-4):
+    """
+    Export the trained model as a frozen TorchScript graph for inference.
+    eval() drops dropout and freeze() inlines the weights as constants.
+    optimize_for_inference() is applied by load_frozen_model() after loading,
+    the optimized graph can't be saved and reloaded.
+    The image shape is fixed to 3x30x30, the batch dimension stays dynamic.
+    """
+    class_names = load_class_names(classes_path)
+    if len(class_names) != num_classes:
+        raise ValueError(f"Number of classes in {classes_path} ({len(class_names)}) does not match NUM_CLASSES ({num_classes})")
+
+    # Load PyTorch model on cpu, the artifact is mapped to the serving device at load time
+    print("Loading PyTorch model...")
+    model = load_eager_model(state_dict_path, num_classes).cpu()
+
+    # one image (channels=3, height=30, width=30), any batch size
+    image_shape = [3, INPUT_SIZE, INPUT_SIZE]
+    example_input = torch.rand(1, *image_shape)
+
+    # embed (fc1 activations) is kept as a second method for the embedding index
+    print("Tracing and freezing...")
+    with torch.no_grad():
+        traced = torch.jit.trace_module(model, {'forward': example_input, 'embed': example_input})
+        frozen = torch.jit.freeze(traced, preserved_attrs=['embed'])
+
+    meta = {
+        'image_shape': image_shape,
+        'num_classes': num_classes,
+        'class_names': class_names,
+    }
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    torch.jit.save(frozen, output_path, _extra_files={'meta.json': json.dumps(meta)})
+
+    # Verify the saved file the way the server loads it, against the eager model,
+    # on a larger batch than the trace because warm-up and the serving pipeline run batches
+    loaded, _ = load_frozen_model(output_path)
+    verify_input = torch.rand(8, *image_shape, device=device)
+    model.to(device)
+    with torch.no_grad():
+        output_difference = torch.max(torch.abs(model(verify_input) - loaded(verify_input))).item()
+        embed_difference = torch.max(torch.abs(model.embed(verify_input) - loaded.embed(verify_input))).item()
+    print(f"  Max difference (eager vs saved): {output_difference}")
+    print(f"  Max difference (eager vs saved embed): {embed_difference}")
+    if max(output_difference, embed_difference) > tolerance:
+        os.remove(output_path)
+        raise RuntimeError(f"Saved model does not match the eager model (max difference "
+                           f"{max(output_difference, embed_difference)} > {tolerance}), removed {output_path}")
+
+    print(f"\nFrozen model saved to: {output_path}")
+    print(f"Model size: {os.path.getsize(output_path) / 1024:.2f} KB")
+
+    return output_path
+
+
+def publish_version(version, state_dict_path=MODEL_PATH, classes_path=CLASSES_PATH,
+                    calibration_path=CALIBRATION_PATH, registry_dir=REGISTRY_DIR):
+    """
+    Export the model into the registry as a new version, with its class names
+    and calibration next to the weights. The version is written to a hidden
+    temp dir, loaded once and renamed, so a running server never sees a
+    half-written or broken version.
+    """
+    version_dir = os.path.join(registry_dir, version)
+    if os.path.exists(version_dir):
+        raise FileExistsError(f"Model version already exists: {version_dir}")
+
+    tmp_dir = os.path.join(registry_dir, f".{version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    export_frozen_model(state_dict_path, os.path.join(tmp_dir, VERSION_FROZEN_MODEL), classes_path)
+    # state dict too, CUDA hosts use it instead of the frozen graph
+    shutil.copyfile(state_dict_path, os.path.join(tmp_dir, VERSION_STATE_DICT))
+    shutil.copyfile(classes_path, os.path.join(tmp_dir, VERSION_CLASSES))
+    if os.path.exists(calibration_path):
+        shutil.copyfile(calibration_path, os.path.join(tmp_dir, VERSION_CALIBRATION))
+
+    # load it the way the server will, a version that can't load is never published
+    try:
+        load_version(tmp_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    os.rename(tmp_dir, version_dir)
+    print(f"Published model version: {version_dir}")
+    return version_dir
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    # python export_model.py [version] -> also publish to the model registry
+    if len(sys.argv) > 1:
+        publish_version(sys.argv[1])
+    else:
+        export_frozen_model()
@@ -0,0 +1,122 @@
+import json
+import os
+import torch
+import torch.nn.functional as F
+from torchvision import transforms
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+MODEL_PATH = './models/simple_cnn_traffic_sign.pth'
+FROZEN_MODEL_PATH = './models/traffic_sign_model.pt'
+CLASSES_PATH = './dataset/valid/_classes.txt'
+CALIBRATION_PATH = './models/calibration.json'
+NUM_CLASSES = 29
+INPUT_SIZE = 30
+TOP_K = 3
+REJECT_THRESHOLD = 0.5
+UNKNOWN_LABEL = 'Unknown sign'
+
+# same preprocessing as training
+test_transform = transforms.Compose([
+    transforms.Resize((INPUT_SIZE, INPUT_SIZE)),
+    transforms.ToTensor(),
+])
+
+
+def load_class_names(classes_path=CLASSES_PATH):
+    with open(classes_path, 'r') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def load_frozen_model(model_path=FROZEN_MODEL_PATH):
+    """
+    Load the frozen TorchScript artifact written by export_model.py.
+    No Python model class is needed, the graph and weights are in the file.
+    optimize_for_inference() runs here and not at export: its MKLDNN constants
+    don't survive torch.jit.save/load.
+    """
+    extra_files = {'meta.json': ''}
+    model = torch.jit.load(model_path, map_location=device, _extra_files=extra_files)
+    meta = json.loads(extra_files['meta.json']) if extra_files['meta.json'] else {}
+    if device.type == 'cpu':
+        other_methods = ['embed'] if hasattr(model, 'embed') else []
+        model = torch.jit.optimize_for_inference(model, other_methods=other_methods)
+    return model, meta
+
+
+def load_eager_model(model_path=MODEL_PATH, num_classes=NUM_CLASSES):
+    from data_nn import TrafficSignClassifier
+
+    model = TrafficSignClassifier(num_classes=num_classes)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
+
+
+def load_model(frozen_path=FROZEN_MODEL_PATH, state_dict_path=MODEL_PATH):
+    """
+    Prefer the frozen artifact on CPU; fall back to rebuilding the model from the state dict.
+    The frozen graph is optimized for CPU only, so CUDA always uses the state dict.
+    A state dict newer than the artifact (retrained, not re-exported) also wins.
+    Returns (model, meta).
+    """
+    if device.type == 'cpu' and os.path.exists(frozen_path):
+        if os.path.exists(state_dict_path) and os.path.getmtime(state_dict_path) > os.path.getmtime(frozen_path):
+            print(f"Warning: {state_dict_path} is newer than {frozen_path}, using the state dict. "
+                  f"Run export_model.py to update the frozen model.")
+        else:
+            print(f"Loading frozen model: {frozen_path}")
+            return load_frozen_model(frozen_path)
+
+    print(f"Loading state dict on {device}: {state_dict_path}")
+    meta = {'image_shape': [3, INPUT_SIZE, INPUT_SIZE], 'num_classes': NUM_CLASSES}
+    return load_eager_model(state_dict_path), meta
+
+
+def warm_up(model, batch_size=8, iterations=3, input_size=INPUT_SIZE):
+    """Run dummy batches so allocator and kernel paths are hot before serving traffic."""
+    if batch_size <= 0 or iterations <= 0:
+        return
+
+    dummy_input = torch.rand(batch_size, 3, input_size, input_size, device=device)
+    with torch.no_grad():
+        for _ in range(iterations):
+            model(dummy_input)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def load_temperature(calibration_path=CALIBRATION_PATH):
+    """Softmax temperature fitted by calibrate.py, 1.0 (uncalibrated) if missing."""
+    if not os.path.exists(calibration_path):
+        return 1.0
+    with open(calibration_path, 'r') as f:
+        return float(json.load(f)['temperature'])
+
+
+def predict_batch(model, inputs, temperature=1.0, top_k=TOP_K, reject_threshold=REJECT_THRESHOLD):
+    """
+    Calibrated top-k prediction for a batch in one pass.
+    Probabilities and class ids are packed into one tensor so there is a
+    single device to host transfer per batch.
+    Returns one dict per image: class_id, confidence, rejected and top_k as (class_id, prob) pairs.
+    """
+    with torch.no_grad():
+        logits = model(inputs)
+        probs = F.softmax(logits / temperature, dim=1)
+        # at least the top-1 class, it is the prediction itself
+        top_probs, top_ids = probs.topk(min(max(1, top_k), probs.size(1)), dim=1)
+        packed = torch.cat([top_probs, top_ids.to(top_probs.dtype)], dim=1).cpu()
+
+    k = top_probs.size(1)
+    results = []
+    for row in packed.tolist():
+        pairs = [(int(class_id), prob) for prob, class_id in zip(row[:k], row[k:])]
+        results.append({
+            'class_id': pairs[0][0],
+            'confidence': pairs[0][1],
+            'rejected': pairs[0][1] < reject_threshold,
+            'top_k': pairs,
+        })
+    return results
@@ -0,0 +1,240 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from inference import device, load_frozen_model, load_eager_model, load_class_names, load_temperature, warm_up
+
+REGISTRY_DIR = './models/registry'
+ROUTING_FILE = 'routing.json'
+
+# file names inside one version directory, weights and class names are versioned together
+VERSION_FROZEN_MODEL = 'model.pt'
+VERSION_STATE_DICT = 'model.pth'
+VERSION_CLASSES = '_classes.txt'
+VERSION_CALIBRATION = 'calibration.json'
+
+
+class ModelVersion:
+    def __init__(self, name, model, class_names, temperature=1.0, mtime=0.0):
+        self.name = name
+        self.model = model
+        self.class_names = class_names
+        self.temperature = temperature
+        self.mtime = mtime
+        self.loaded_at = time.time()
+
+
+class VersionMetrics:
+    """Request count, rejection rate, batch latency and confidence of one model version."""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        self.confidence_sum = 0.0
+        self.latencies_ms = deque(maxlen=window)
+
+    def record(self, latency_ms, confidences, rejected):
+        """One inference batch: its latency once, confidence and rejection per request."""
+        with self.lock:
+            self.requests += len(confidences)
+            self.rejected += sum(int(r) for r in rejected)
+            self.confidence_sum += sum(confidences)
+            self.latencies_ms.append(latency_ms)
+
+    def summary(self):
+        with self.lock:
+            latencies = sorted(self.latencies_ms)
+            requests = self.requests
+            summary = {
+                'requests': requests,
+                'rejected': self.rejected,
+                'mean_confidence': self.confidence_sum / requests if requests else None,
+            }
+
+        if latencies:
+            summary['p50_ms'] = latencies[len(latencies) // 2]
+            summary['p95_ms'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return summary
+
+
+def load_version(version_dir):
+    """
+    Load one registry version: frozen model (CPU only) or state dict, plus its own
+    class names and temperature.
+    """
+    frozen_path = os.path.join(version_dir, VERSION_FROZEN_MODEL)
+    state_dict_path = os.path.join(version_dir, VERSION_STATE_DICT)
+    classes_path = os.path.join(version_dir, VERSION_CLASSES)
+
+    meta = {}
+    if device.type == 'cpu' and os.path.exists(frozen_path):
+        model, meta = load_frozen_model(frozen_path)
+    else:
+        class_names = load_class_names(classes_path)
+        model = load_eager_model(state_dict_path, num_classes=len(class_names))
+
+    if os.path.exists(classes_path):
+        class_names = load_class_names(classes_path)
+    elif meta.get('class_names'):
+        class_names = meta['class_names']
+    else:
+        raise FileNotFoundError(f"No class names for model version in {version_dir}")
+
+    temperature = load_temperature(os.path.join(version_dir, VERSION_CALIBRATION))
+    return model, class_names, temperature
+
+
+def version_mtime(version_dir):
+    return max(os.path.getmtime(os.path.join(version_dir, name)) for name in os.listdir(version_dir))
+
+
+class ModelRegistry:
+    """
+    Watches the registry directory, loads and warms up new versions in the
+    background and swaps them in without restarting the server.
+    The serving state (versions, routing weights) is replaced as one object,
+    so a request always sees a consistent snapshot.
+    """
+
+    def __init__(self, registry_dir=REGISTRY_DIR, warmup_batch_size=8, warmup_iterations=3, poll_interval=5.0):
+        self.registry_dir = registry_dir
+        self.warmup_batch_size = warmup_batch_size
+        self.warmup_iterations = warmup_iterations
+        self.poll_interval = poll_interval
+
+        self._state = ({}, {})  # (versions by name, routing weights by name)
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+        self._thread = None
+
+    def register(self, name, model, class_names, temperature=1.0):
+        """
+        Serve a model that is not in the registry directory (e.g. the default artifact).
+        It is replaced as soon as versions are published to the registry.
+        """
+        version = ModelVersion(name, model, class_names, temperature)
+        versions = dict(self._state[0])
+        versions[name] = version
+        self._state = (versions, self._routing(versions))
+
+    def list_version_dirs(self):
+        if not os.path.isdir(self.registry_dir):
+            return {}
+
+        version_dirs = {}
+        for name in sorted(os.listdir(self.registry_dir)):
+            path = os.path.join(self.registry_dir, name)
+            # skip hidden dirs, publishing writes to a hidden temp dir and renames it
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            if os.path.exists(os.path.join(path, VERSION_FROZEN_MODEL)) or os.path.exists(os.path.join(path, VERSION_STATE_DICT)):
+                version_dirs[name] = path
+        return version_dirs
+
+    def refresh(self):
+        """Load new or changed versions, drop removed ones and re-read routing. Returns True if anything changed."""
+        version_dirs = self.list_version_dirs()
+        current_versions, current_weights = self._state
+        if not version_dirs:
+            # nothing published yet, keep serving what we have
+            return False
+
+        versions = {}
+        changed = False
+        for name, path in version_dirs.items():
+            mtime = version_mtime(path)
+            current = current_versions.get(name)
+            if current is not None and current.mtime == mtime:
+                versions[name] = current
+                continue
+
+            try:
+                model, class_names, temperature = load_version(path)
+                warm_up(model, batch_size=self.warmup_batch_size, iterations=self.warmup_iterations)
+            except Exception as e:
+                print(f"Error. Could not load model version {name}: {e}")
+                if current is not None:
+                    versions[name] = current
+                continue
+
+            versions[name] = ModelVersion(name, model, class_names, temperature, mtime)
+            changed = True
+            print(f"Loaded model version: {name}")
+
+        if not versions:
+            return False
+
+        weights = self._routing(versions)
+        changed = changed or set(versions) != set(current_versions) or weights != current_weights
+        if changed:
+            # atomic swap of the serving reference
+            self._state = (versions, weights)
+            print(f"Serving versions: {weights}")
+        return changed
+
+    def _routing(self, versions):
+        """Traffic weights from routing.json, or all traffic to the newest version."""
+        routing_path = os.path.join(self.registry_dir, ROUTING_FILE)
+        weights = {}
+        if os.path.exists(routing_path):
+            try:
+                with open(routing_path, 'r') as f:
+                    weights = {name: float(w) for name, w in json.load(f).items() if name in versions and float(w) > 0}
+            except (ValueError, OSError) as e:
+                print(f"Warning: Could not read {routing_path}: {e}")
+
+        if not weights:
+            # newest by publish time, version names need not sort chronologically
+            newest = max(versions, key=lambda name: (versions[name].mtime, versions[name].loaded_at))
+            weights = {newest: 1.0}
+        return weights
+
+    def choose(self):
+        """Pick a model version for one request according to the routing weights."""
+        versions, weights = self._state
+        if not weights:
+            return None
+        names = list(weights)
+        name = random.choices(names, weights=[weights[n] for n in names])[0]
+        return versions[name]
+
+    def get(self, name):
+        """A specific loaded version, or None."""
+        return self._state[0].get(name)
+
+    def record(self, version_name, latency_ms, confidences, rejected):
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(version_name, VersionMetrics())
+        metrics.record(latency_ms, confidences, rejected)
+
+    def metrics(self):
+        versions, weights = self._state
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        return {
+            name: {
+                'weight': weights.get(name, 0.0),
+                'loaded_at': versions[name].loaded_at if name in versions else None,
+                **(metrics[name].summary() if name in metrics else {'requests': 0}),
+            }
+            for name in set(versions) | set(metrics)
+        }
+
+    def is_ready(self):
+        return bool(self._state[1])
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error. Model registry refresh failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='model-registry-watcher', daemon=True)
+            self._thread.start()
@@ -0,0 +1,142 @@
+import multiprocessing
+import queue
+import threading
+import time
+import numpy as np
+import torch
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from inference import device, predict_batch
+from preprocess import decode_image, init_decode_worker
+
+
+class PipelineFull(Exception):
+    """Raised when a stage queue is full, the server answers 429."""
+
+
+def create_decode_pool(num_workers):
+    """
+    Process pool for image decode. Create it before the model is loaded and
+    before core pinning: forked workers should not inherit torch thread pools
+    or the inference cores. Where fork is not available (Windows) the workers
+    are spawned and load their functions from the torch-free preprocess.py.
+    """
+    start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context(start_method),
+                               initializer=init_decode_worker)
+    # start every worker now instead of on the first requests
+    for future in [pool.submit(init_decode_worker) for _ in range(num_workers)]:
+        future.result()
+    return pool
+
+
+class InferencePipeline:
+    """
+    Staged request pipeline:
+    request thread -> decode process pool -> bounded queue -> inference thread.
+    The inference thread owns the models and batches whatever is queued, so decode
+    and inference overlap. Each stage is bounded and rejects work when full.
+    """
+
+    def __init__(self, registry, decode_pool, decode_workers, max_pending_decode=64, max_queued=64,
+                 max_batch_size=32, predict_args=None, embed=None):
+        self.registry = registry
+        self.decode_pool = decode_pool
+        self.decode_workers = decode_workers
+        self.decode_pool_lock = threading.Lock()
+        self.max_batch_size = max_batch_size
+        self.predict_args = predict_args or {}
+        self.embed = embed  # optional (batch tensor -> embeddings), run on the inference thread
+
+        self.decode_slots = threading.BoundedSemaphore(max_pending_decode + decode_workers)
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.thread = threading.Thread(target=self._run, name='inference', daemon=True)
+        self.thread.start()
+
+    def submit(self, image_bytes, embedding_only=False):
+        """
+        Queue one image. Returns a Future with a dict: version (ModelVersion), prediction
+        (see predict_batch) and embedding (None without an embedding index).
+        embedding_only requests (/neighbors, /exemplars) are left out of the version metrics.
+        Raises PipelineFull instead of blocking when the decode stage is full.
+        """
+        if not self.decode_slots.acquire(blocking=False):
+            raise PipelineFull('decode queue is full')
+
+        result = Future()
+        try:
+            decode_future = self._submit_decode(image_bytes)
+        except Exception:
+            self.decode_slots.release()
+            raise
+        decode_future.add_done_callback(lambda f: self._on_decoded(f, result, embedding_only))
+        return result
+
+    def _submit_decode(self, image_bytes):
+        pool = self.decode_pool
+        try:
+            return pool.submit(decode_image, image_bytes)
+        except BrokenProcessPool:
+            # a crashed worker breaks the executor for good, replace it once for all request threads
+            with self.decode_pool_lock:
+                if self.decode_pool is pool:
+                    print("Warning: decode pool is broken, restarting it")
+                    pool.shutdown(wait=False)
+                    self.decode_pool = create_decode_pool(self.decode_workers)
+            return self.decode_pool.submit(decode_image, image_bytes)
+
+    def _on_decoded(self, decode_future, result, embedding_only):
+        self.decode_slots.release()
+        try:
+            image = decode_future.result()
+        except Exception as e:
+            result.set_exception(e)
+            return
+
+        try:
+            self.queue.put_nowait((image, result, embedding_only))
+        except queue.Full:
+            result.set_exception(PipelineFull('inference queue is full'))
+
+    def _next_batch(self):
+        # block for the first item, then take whatever else is already waiting
+        batch = [self.queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            results = [result for _, result, _ in batch]
+            try:
+                images = np.stack([image for image, _, _ in batch])
+                # uint8 NHWC -> float NCHW in [0, 1], same as ToTensor()
+                inputs = torch.from_numpy(images).to(device).permute(0, 3, 1, 2).float().div_(255).contiguous()
+
+                # one version per batch so the whole batch runs on one model
+                version = self.registry.choose()
+                start = time.perf_counter()
+                predictions = predict_batch(version.model, inputs, temperature=version.temperature, **self.predict_args)
+                latency_ms = (time.perf_counter() - start) * 1000
+                embeddings = self.embed(inputs) if self.embed is not None else None
+            except Exception as e:
+                for result in results:
+                    result.set_exception(e)
+                continue
+
+            # batch latency once, confidence and rejection of the classification requests only
+            classified = [prediction for prediction, (_, _, embedding_only) in zip(predictions, batch) if not embedding_only]
+            if classified:
+                self.registry.record(version.name, latency_ms,
+                                     [p['confidence'] for p in classified], [p['rejected'] for p in classified])
+
+            for i, (prediction, result) in enumerate(zip(predictions, results)):
+                result.set_result({
+                    'version': version,
+                    'prediction': prediction,
+                    'embedding': embeddings[i:i + 1] if embeddings is not None else None,
+                })
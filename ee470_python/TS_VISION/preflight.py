@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from train_model import parse_annotation_line, CLEAN_ANNOTATION_NAME
+
+DATA_DIR_PATH = './dataset/'
+SPLITS = ['train', 'valid', 'test']
+REPORT_NAME = 'preflight_report.json'
+
+# leaked images are dropped from the first split of the pair, test stays the untouched holdout
+LEAK_DROP_ORDER = {'train': 0, 'valid': 1, 'test': 2}
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash: near-duplicate images differ in only a few bits."""
+    pixels = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def check_image(img_path):
+    """Runs in a worker process. Returns (error, hash)."""
+    if not os.path.exists(img_path):
+        return 'missing', None
+    try:
+        with Image.open(img_path) as image:
+            image.load()  # force a full decode, verify() only checks headers
+            return None, dhash(image)
+    except Exception as e:
+        return f'decode error: {e}', None
+
+
+def read_manifest(split_dir):
+    """Every annotation line with its parsed entry or parse error."""
+    rows = []
+    with open(os.path.join(split_dir, '_annotations.txt'), 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = parse_annotation_line(line)
+            except ValueError as e:
+                rows.append({'line_no': line_no, 'line': line.rstrip('\n'), 'error': str(e)})
+                continue
+            if entry is None:
+                rows.append({'line_no': line_no, 'line': line.rstrip('\n'), 'error': 'no image name'})
+                continue
+            rows.append({'line_no': line_no, 'line': line.rstrip('\n'), 'img_name': entry[0], 'class_id': entry[1], 'error': None})
+    return rows
+
+
+def hamming_distances(hash_value, hashes):
+    xor = np.bitwise_xor(hashes, np.uint64(hash_value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def find_cross_split_duplicates(rows_by_split, max_distance):
+    """(split, row, other split, other row, distance) for every image pair across two splits within max_distance bits."""
+    hashed = {}
+    for split, rows in rows_by_split.items():
+        rows = [row for row in rows if row.get('hash') is not None]
+        hashed[split] = (rows, np.array([row['hash'] for row in rows], dtype=np.uint64))
+
+    duplicates = []
+    splits = list(hashed)
+    for i, split_a in enumerate(splits):
+        for split_b in splits[i + 1:]:
+            rows_a, _ = hashed[split_a]
+            rows_b, hashes_b = hashed[split_b]
+            if not len(hashes_b):
+                continue
+            for row in rows_a:
+                distances = hamming_distances(row['hash'], hashes_b)
+                for j in np.nonzero(distances <= max_distance)[0]:
+                    duplicates.append((split_a, row, split_b, rows_b[j], int(distances[j])))
+    return duplicates
+
+
+def preflight(data_dir=DATA_DIR_PATH, num_workers=None, max_distance=4, write_manifest=True):
+    # class names must be the same in every split
+    class_names = {}
+    for split in SPLITS:
+        with open(os.path.join(data_dir, split, '_classes.txt'), 'r') as f:
+            class_names[split] = [line.strip() for line in f.readlines()]
+    reference_classes = class_names[SPLITS[0]]
+    class_mismatch = [split for split in SPLITS if class_names[split] != reference_classes]
+    num_classes = len(reference_classes)
+
+    rows_by_split = {split: read_manifest(os.path.join(data_dir, split)) for split in SPLITS}
+
+    # decode and hash every referenced image in parallel
+    jobs = [(split, row) for split in SPLITS for row in rows_by_split[split] if row['error'] is None]
+    paths = [os.path.join(data_dir, split, row['img_name']) for split, row in jobs]
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = executor.map(check_image, paths, chunksize=64)
+        for (split, row), (error, hash_value) in zip(jobs, results):
+            row['error'] = error
+            row['hash'] = hash_value
+
+    for rows in rows_by_split.values():
+        for row in rows:
+            if row['error'] is None and not 0 <= row['class_id'] < num_classes:
+                row['error'] = f"class id {row['class_id']} not in _classes.txt ({num_classes} classes)"
+
+    # duplicates inside a split are only reported, across splits they leak evaluation data
+    duplicates = find_cross_split_duplicates(rows_by_split, max_distance)
+    for split_a, row_a, split_b, row_b, distance in duplicates:
+        drop_row = row_a if LEAK_DROP_ORDER[split_a] < LEAK_DROP_ORDER[split_b] else row_b
+        other_split, other_row = (split_b, row_b) if drop_row is row_a else (split_a, row_a)
+        if drop_row['error'] is None:
+            drop_row['error'] = f"duplicate of {other_split}/{other_row['img_name']} (distance {distance})"
+
+    within_split = {}
+    for split, rows in rows_by_split.items():
+        seen = {}
+        for row in rows:
+            if row.get('hash') is None:
+                continue
+            if row['hash'] in seen:
+                within_split.setdefault(split, []).append([seen[row['hash']], row['img_name']])
+            else:
+                seen[row['hash']] = row['img_name']
+
+    report = {
+        'class_mismatch': class_mismatch,
+        'num_classes': num_classes,
+        'cross_split_duplicates': len(duplicates),
+        'within_split_duplicates': {split: len(pairs) for split, pairs in within_split.items()},
+        'splits': {},
+    }
+
+    for split in SPLITS:
+        rows = rows_by_split[split]
+        errors = [row for row in rows if row['error'] is not None]
+        report['splits'][split] = {
+            'lines': len(rows),
+            'clean': len(rows) - len(errors),
+            'dropped': [{'line_no': row['line_no'], 'line': row['line'], 'error': row['error']} for row in errors],
+        }
+        print(f"{split}: {len(rows)} lines, {len(errors)} dropped")
+
+        if write_manifest:
+            manifest_path = os.path.join(data_dir, split, CLEAN_ANNOTATION_NAME)
+            with open(manifest_path, 'w') as f:
+                for row in rows:
+                    if row['error'] is None:
+                        f.write(row['line'] + '\n')
+
+    if class_mismatch:
+        print(f"Warning: _classes.txt differs from {SPLITS[0]} in: {', '.join(class_mismatch)}")
+    print(f"Cross-split duplicates: {len(duplicates)}")
+
+    report_path = os.path.join(data_dir, REPORT_NAME)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {report_path}")
+
+    return report
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Check the dataset before training and write cleaned manifests.')
+    parser.add_argument('--workers', type=int, default=None, help='decode processes (default: all cores)')
+    parser.add_argument('--max-distance', type=int, default=4, help='dHash bits for a near-duplicate')
+    parser.add_argument('--no-manifest', action='store_true', help='only report, do not write _annotations.clean.txt')
+    args = parser.parse_args()
+
+    preflight(num_workers=args.workers, max_distance=args.max_distance, write_manifest=not args.no_manifest)
@@ -0,0 +1,76 @@
+from PIL import Image, ExifTags
+import io
+import numpy as np
+
+# Decode runs in worker processes (pipeline.create_decode_pool). Forked workers inherit the
+# server's torch import, spawned ones load decode_image from here, so it stays free of torch.
+INPUT_SIZE = 30
+
+
+def init_decode_worker():
+    """Decode pool initializer, loads the PIL format plugins before the first request."""
+    Image.init()
+
+
+def fix_image_orientation(image):
+    """
+    Fix image orientation based on EXIF data.
+    Camera photos often have rotation metadata that needs to be applied.
+    """
+    try:
+        # Get EXIF data
+        exif = image._getexif()
+        if exif is None:
+            return image
+        
+        # Find the orientation tag
+        orientation_key = None
+        for key, value in ExifTags.TAGS.items():
+            if value == 'Orientation':
+                orientation_key = key
+                break
+        
+        if orientation_key is None or orientation_key not in exif:
+            return image
+        
+        orientation = exif[orientation_key]
+        
+        # Apply rotation based on orientation value
+        if orientation == 2:
+            image = image.transpose(Image.FLIP_LEFT_RIGHT)
+        elif orientation == 3:
+            image = image.rotate(180, expand=True)
+        elif orientation == 4:
+            image = image.transpose(Image.FLIP_TOP_BOTTOM)
+        elif orientation == 5:
+            image = image.transpose(Image.FLIP_LEFT_RIGHT).rotate(270, expand=True)
+        elif orientation == 6:
+            image = image.rotate(270, expand=True)
+        elif orientation == 7:
+            image = image.transpose(Image.FLIP_LEFT_RIGHT).rotate(90, expand=True)
+        elif orientation == 8:
+            image = image.rotate(90, expand=True)
+            
+    except (AttributeError, KeyError, IndexError, TypeError):
+        # If anything goes wrong, just return the original image
+        pass
+    
+    return image
+
+
+def decode_image(image_bytes, input_size=INPUT_SIZE):
+    """
+    Decode and preprocess one uploaded image into a compact (30, 30, 3) uint8 array.
+    Runs in a decode worker process; the inference thread converts it to a float tensor.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    
+    # Fix orientation for camera photos (EXIF rotation)
+    image = fix_image_orientation(image)
+    
+    # Convert to RGB after fixing orientation
+    image = image.convert('RGB')
+    
+    # same resize as transforms.Resize on PIL images
+    image = image.resize((input_size, input_size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
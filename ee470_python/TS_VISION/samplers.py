@@ -0,0 +1,87 @@
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler, WeightedRandomSampler
+
+
+class IndexedDataset(Dataset):
+    """Wrap a dataset so every item also returns its index, needed to track per-sample loss."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        image_tensor, label_tensor = self.dataset[idx]
+        return image_tensor, label_tensor, idx
+
+
+def class_histogram(class_ids, num_classes):
+    return np.bincount(np.asarray(class_ids, dtype=np.int64), minlength=num_classes)
+
+
+def class_balanced_weights(class_ids, num_classes, power=1.0):
+    """
+    Per-sample weights proportional to 1 / class_count^power.
+    power=1 samples every class equally often, power=0.5 is a softer balance.
+    """
+    class_ids = np.asarray(class_ids, dtype=np.int64)
+    counts = class_histogram(class_ids, num_classes).astype(np.float64)
+    class_weights = np.zeros(num_classes)
+    class_weights[counts > 0] = 1.0 / counts[counts > 0] ** power
+    return class_weights[class_ids]
+
+
+def class_balanced_sampler(class_ids, num_classes, num_samples=None, power=1.0):
+    weights = class_balanced_weights(class_ids, num_classes, power)
+    return WeightedRandomSampler(
+        torch.as_tensor(weights, dtype=torch.double),
+        num_samples=num_samples or len(weights),
+        replacement=True
+    )
+
+
+class HardExampleSampler(Sampler):
+    """
+    Class-balanced sampling re-weighted by each sample's recent loss (online hard-example mining).
+    Losses are kept as an exponential moving average in one float32 array, one value per sample.
+    Samples that were never seen use the mean loss so they still get drawn.
+    """
+
+    def __init__(self, class_ids, num_classes, num_samples=None, balance_power=1.0,
+                 hardness=1.0, momentum=0.9, min_weight=0.1):
+        self.base_weights = class_balanced_weights(class_ids, num_classes, balance_power)
+        self.num_samples = num_samples or len(self.base_weights)
+        self.hardness = hardness      # 0 -> class balanced only, higher -> focus on hard samples
+        self.momentum = momentum
+        self.min_weight = min_weight  # floor so easy samples are not forgotten entirely
+
+        self.losses = np.zeros(len(self.base_weights), dtype=np.float32)
+        self.seen = np.zeros(len(self.base_weights), dtype=bool)
+
+    def update(self, indices, losses):
+        """Record the per-sample losses of a training batch."""
+        indices = torch.as_tensor(indices).cpu().numpy()
+        losses = torch.as_tensor(losses).detach().float().cpu().numpy()
+
+        # a sample can appear twice in a batch when drawing with replacement, last value wins
+        seen = self.seen[indices]
+        self.losses[indices] = np.where(seen, self.momentum * self.losses[indices] + (1 - self.momentum) * losses, losses)
+        self.seen[indices] = True
+
+    def weights(self):
+        if not self.seen.any() or self.hardness == 0:
+            return self.base_weights
+
+        mean_loss = self.losses[self.seen].mean()
+        losses = np.where(self.seen, self.losses, mean_loss)
+        relative_loss = np.maximum(losses / max(mean_loss, 1e-8), self.min_weight)
+        return self.base_weights * relative_loss ** self.hardness
+
+    def __iter__(self):
+        weights = torch.as_tensor(self.weights(), dtype=torch.double)
+        return iter(torch.multinomial(weights, self.num_samples, replacement=True).tolist())
+
+    def __len__(self):
+        return self.num_samples
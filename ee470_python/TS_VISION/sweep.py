@@ -0,0 +1,191 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import statistics
+import time
+import torch
+import torch.multiprocessing as mp
+import torch.optim as optim
+from torch.utils.data import DataLoader, TensorDataset
+from torchvision import transforms
+from data_nn import TrafficSignClassifier, train_model, evaluate_model, criterion, device, NUM_CLASSES, LEARNING_RATE
+from train_model import AnnotationDataset, annotation_file_for, BATCH_SIZE, NUM_EPOCHS
+
+DATA_DIR_PATH = './dataset/'
+SWEEP_DB_PATH = './models/sweeps.db'
+
+SEARCH_SPACE = {
+    'lr': [LEARNING_RATE / 3, LEARNING_RATE, LEARNING_RATE * 3],
+    'batch_size': [BATCH_SIZE // 2, BATCH_SIZE, BATCH_SIZE * 2],
+}
+
+# images are decoded once and kept as uint8 (4x smaller than float)
+uint8_transform = transforms.Compose([
+    transforms.Resize((30, 30)),
+    transforms.PILToTensor(),
+])
+
+# set in every trial process by init_worker
+shared_data = {}
+
+
+def load_split(split, num_workers=0):
+    """Decode one split into a single (N, 3, 30, 30) uint8 tensor in shared memory."""
+    split_dir = os.path.join(DATA_DIR_PATH, split)
+    dataset = AnnotationDataset(
+        annotation_file=annotation_file_for(split_dir),
+        img_dir=split_dir,
+        transform=uint8_transform
+    )
+    loader = DataLoader(dataset, batch_size=256, num_workers=num_workers)
+
+    images, labels = [], []
+    for batch_images, batch_labels in loader:
+        images.append(batch_images)
+        labels.append(batch_labels)
+    return torch.cat(images).share_memory_(), torch.cat(labels).share_memory_()
+
+
+def collate_uint8(batch):
+    images, labels = zip(*batch)
+    return torch.stack(images).float().div_(255), torch.stack(labels)
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("""CREATE TABLE IF NOT EXISTS trials (
+        sweep_id TEXT, trial_id INTEGER, params TEXT, status TEXT,
+        best_val_accuracy REAL, epochs INTEGER, seconds REAL,
+        PRIMARY KEY (sweep_id, trial_id))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS epochs (
+        sweep_id TEXT, trial_id INTEGER, epoch INTEGER,
+        train_loss REAL, train_accuracy REAL, val_accuracy REAL,
+        PRIMARY KEY (sweep_id, trial_id, epoch))""")
+    return conn
+
+
+def should_prune(conn, sweep_id, trial_id, epoch, val_accuracy, min_trials=3, warmup_epochs=1):
+    """Median pruning: stop if this trial is below the median of the other trials at the same epoch."""
+    if epoch < warmup_epochs:
+        return False
+    rows = conn.execute(
+        "SELECT val_accuracy FROM epochs WHERE sweep_id = ? AND epoch = ? AND trial_id != ?",
+        (sweep_id, epoch, trial_id)
+    ).fetchall()
+    if len(rows) < min_trials:
+        return False
+    return val_accuracy < statistics.median(r[0] for r in rows)
+
+
+def init_worker(train_data, valid_data, threads_per_trial):
+    shared_data['train'] = train_data
+    shared_data['valid'] = valid_data
+    torch.set_num_threads(threads_per_trial)
+
+
+def run_trial(sweep_id, trial_id, params, num_epochs, db_path):
+    torch.manual_seed(trial_id)
+    start = time.time()
+
+    train_loader = DataLoader(TensorDataset(*shared_data['train']), batch_size=params['batch_size'],
+                              shuffle=True, collate_fn=collate_uint8)
+    valid_loader = DataLoader(TensorDataset(*shared_data['valid']), batch_size=256,
+                              collate_fn=collate_uint8)
+
+    # same device train_model/evaluate_model move the batches to
+    model = TrafficSignClassifier(NUM_CLASSES).to(device)
+    optimizer = optim.Adam(model.parameters(), lr=params['lr'])
+
+    conn = connect(db_path)
+    conn.execute("INSERT INTO trials VALUES (?, ?, ?, 'running', NULL, 0, NULL)",
+                 (sweep_id, trial_id, json.dumps(params)))
+    conn.commit()
+
+    history = []
+
+    def on_epoch_end(epoch, train_loss, train_accuracy):
+        val_accuracy = evaluate_model(model, valid_loader)
+        history.append(val_accuracy)
+        with conn:
+            conn.execute("INSERT INTO epochs VALUES (?, ?, ?, ?, ?, ?)",
+                         (sweep_id, trial_id, epoch, train_loss, train_accuracy, val_accuracy))
+        print(f"[trial {trial_id}] epoch {epoch + 1}, val accuracy %{val_accuracy:.2f}")
+        return should_prune(conn, sweep_id, trial_id, epoch, val_accuracy)
+
+    train_model(model, train_loader, criterion, optimizer, num_epochs=num_epochs, on_epoch_end=on_epoch_end)
+
+    status = 'pruned' if len(history) < num_epochs else 'complete'
+    best_val_accuracy = max(history) if history else None
+    with conn:
+        conn.execute("UPDATE trials SET status = ?, best_val_accuracy = ?, epochs = ?, seconds = ? WHERE sweep_id = ? AND trial_id = ?",
+                     (status, best_val_accuracy, len(history), time.time() - start, sweep_id, trial_id))
+    conn.close()
+
+    return trial_id, params, status, best_val_accuracy
+
+
+def trial_params(num_trials=None, seed=0):
+    """Full grid over SEARCH_SPACE, or a random subset of num_trials points."""
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(SEARCH_SPACE[k] for k in keys))]
+    if num_trials is not None and num_trials < len(grid):
+        grid = random.Random(seed).sample(grid, num_trials)
+    return grid
+
+
+def run_sweep(num_workers=2, threads_per_trial=None, num_epochs=NUM_EPOCHS, num_trials=None, db_path=SWEEP_DB_PATH):
+    sweep_id = time.strftime('%Y%m%d-%H%M%S')
+    if threads_per_trial is None:
+        # split the cores between parallel trials so they do not oversubscribe
+        threads_per_trial = max(1, (os.cpu_count() or 1) // num_workers)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    connect(db_path).close()
+
+    # decode once, every trial process maps the same shared memory
+    print("Loading dataset...")
+    train_data = load_split('train', num_workers=num_workers)
+    valid_data = load_split('valid', num_workers=num_workers)
+    print(f"Train: {len(train_data[1])} images, Valid: {len(valid_data[1])} images")
+
+    all_params = trial_params(num_trials)
+    print(f"Sweep {sweep_id}: {len(all_params)} trials, {num_workers} workers x {threads_per_trial} threads")
+
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(num_workers, initializer=init_worker, initargs=(train_data, valid_data, threads_per_trial)) as pool:
+        jobs = [pool.apply_async(run_trial, (sweep_id, trial_id, params, num_epochs, db_path))
+                for trial_id, params in enumerate(all_params)]
+        results = [job.get() for job in jobs]
+
+    results = [r for r in results if r[3] is not None]
+    results.sort(key=lambda r: r[3], reverse=True)
+    print("\nResults:")
+    for trial_id, params, status, best_val_accuracy in results:
+        print(f"  trial {trial_id} {params} {status}: %{best_val_accuracy:.2f}")
+
+    if results:
+        print(f"\nBest: {results[0][1]} -> %{results[0][3]:.2f}")
+    print(f"Results saved to: {db_path} (sweep_id={sweep_id})")
+    return results
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep with median pruning.')
+    parser.add_argument('--workers', type=int, default=2, help='trials running in parallel')
+    parser.add_argument('--threads-per-trial', type=int, default=None, help='torch threads per trial (default: cores / workers)')
+    parser.add_argument('--epochs', type=int, default=NUM_EPOCHS)
+    parser.add_argument('--trials', type=int, default=None, help='random subset of the grid (default: full grid)')
+    parser.add_argument('--db', default=SWEEP_DB_PATH)
+    args = parser.parse_args()
+
+    run_sweep(
+        num_workers=args.workers,
+        threads_per_trial=args.threads_per_trial,
+        num_epochs=args.epochs,
+        num_trials=args.trials,
+        db_path=args.db
+    )
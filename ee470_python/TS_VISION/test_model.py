@@ -1,24 +1,16 @@
 import torch
 import torch.nn.functional as F
-from torchvision import transforms
 from PIL import Image
 import os
 import random
 import matplotlib.pyplot as plt
-from data_nn import TrafficSignClassifier, device 
+from inference import device, load_model, load_class_names, test_transform, NUM_CLASSES
 
-# load model
-MODEL_PATH = './models/simple_cnn_traffic_sign.pth'
-NUM_CLASSES = 29  # class number
-
-model = TrafficSignClassifier(num_classes=NUM_CLASSES)
-model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-model.to(device)
-model.eval()  # for test
+# load model (frozen artifact if exported)
+model, model_meta = load_model()
 
 # class labels
-with open('./dataset/valid/_classes.txt', 'r') as f:
-    class_names = [line.strip() for line in f.readlines()]
+class_names = model_meta.get('class_names') or load_class_names()
 
 if len(class_names) != NUM_CLASSES:
     raise ValueError(f"Number of classes in classes.txt ({len(class_names)}) does not match NUM_CLASSES ({NUM_CLASSES})")
@@ -36,11 +28,6 @@ img_name = random.choice(all_images)
 img_path = os.path.join(TEST_DIR, img_name)
 print(f"\nSelected image: {img_name}")
 
-test_transform = transforms.Compose([
-    transforms.Resize((30, 30)),  #same size train
-    transforms.ToTensor(),
-])
-
 image = Image.open(img_path).convert('RGB')
 image_tensor = test_transform(image).unsqueeze(0).to(device)  # (1, 3, 30, 30)
 
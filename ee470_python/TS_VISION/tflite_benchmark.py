@@ -0,0 +1,138 @@
+import argparse
+import os
+import queue
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from torchvision import transforms
+from train_model import AnnotationDataset, annotation_file_for
+
+# the model shipped in the mobile app
+MOBILE_MODEL_PATH = '../../ee470_mobile/traffic_sign_app/assets/traffic_sign_model.tflite'
+TEST_DIR = './dataset/test'
+INPUT_SIZE = 30
+
+
+def get_interpreter_class():
+    """tflite_runtime on CI boxes without TensorFlow, tf.lite otherwise."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def create_interpreter(model_path, num_threads=1):
+    # XNNPACK is the default CPU delegate for float models, num_threads is passed to it
+    Interpreter = get_interpreter_class()
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+def load_test_split(data_dir=TEST_DIR):
+    """Whole split as (N, 30, 30, 3) float32 in [0, 1] (NHWC, same as the app) and int labels."""
+    dataset = AnnotationDataset(
+        annotation_file=annotation_file_for(data_dir),
+        img_dir=data_dir,
+        transform=transforms.Compose([
+            transforms.Resize((INPUT_SIZE, INPUT_SIZE)),
+            np.asarray,
+        ])
+    )
+
+    images = np.empty((len(dataset), INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+    labels = np.empty(len(dataset), dtype=np.int64)
+    for i in range(len(dataset)):
+        image, label = dataset[i]
+        images[i] = image / 255.0
+        labels[i] = label.item()
+    return images, labels
+
+
+def invoke_batch(interpreter, batch):
+    """Run one batch, resizing the interpreter input when the batch size changes."""
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    if input_details['shape'][0] != len(batch):
+        interpreter.resize_tensor_input(input_details['index'], [len(batch), INPUT_SIZE, INPUT_SIZE, 3])
+        interpreter.allocate_tensors()
+
+    interpreter.set_tensor(input_details['index'], batch)
+    interpreter.invoke()
+    return interpreter.get_tensor(output_details['index'])
+
+
+def run_batched(interpreter, images, batch_size=64):
+    """One interpreter, input resized to batch_size."""
+    outputs = []
+    for start in range(0, len(images), batch_size):
+        outputs.append(invoke_batch(interpreter, images[start:start + batch_size]))
+    return np.concatenate(outputs)
+
+
+def run_pool(interpreters, images, batch_size=1):
+    """A pool of single-threaded interpreters, one per worker thread (invoke releases the GIL)."""
+    # each worker checks an interpreter out, they are not safe to share between threads
+    idle = queue.Queue()
+    for interpreter in interpreters:
+        idle.put(interpreter)
+
+    def worker(start):
+        interpreter = idle.get()
+        try:
+            return invoke_batch(interpreter, images[start:start + batch_size])
+        finally:
+            idle.put(interpreter)
+
+    with ThreadPoolExecutor(max_workers=len(interpreters)) as executor:
+        outputs = list(executor.map(worker, range(0, len(images), batch_size)))
+    return np.concatenate(outputs)
+
+
+def evaluate(model_path=MOBILE_MODEL_PATH, data_dir=TEST_DIR, mode='batch', batch_size=64, num_threads=1, num_workers=4):
+    print(f"Model: {model_path}")
+    print(f"Loading {data_dir}...")
+    images, labels = load_test_split(data_dir)
+
+    # create, allocate and warm every interpreter untimed, so setup and delegate init are not measured
+    if mode == 'pool':
+        interpreters = [create_interpreter(model_path, num_threads=1) for _ in range(num_workers)]
+    else:
+        interpreters = [create_interpreter(model_path, num_threads)]
+    for interpreter in interpreters:
+        interpreter.allocate_tensors()
+        invoke_batch(interpreter, images[:batch_size])
+
+    start = time.perf_counter()
+    if mode == 'pool':
+        outputs = run_pool(interpreters, images, batch_size)
+    else:
+        outputs = run_batched(interpreters[0], images, batch_size)
+    elapsed = time.perf_counter() - start
+
+    accuracy = 100 * float(np.mean(np.argmax(outputs, axis=1) == labels))
+
+    print(f"Mode: {mode}, batch size: {batch_size}, " +
+          (f"workers: {num_workers}" if mode == 'pool' else f"threads: {num_threads}"))
+    print(f"Images: {len(images)}")
+    print(f"Accuracy: %{accuracy:.2f}")
+    print(f"Throughput: {len(images) / elapsed:.1f} images/sec ({elapsed * 1000 / len(images):.3f} ms/image)")
+
+    return {'accuracy': accuracy, 'images_per_sec': len(images) / elapsed}
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Evaluate and profile a .tflite model on the test split.')
+    parser.add_argument('--model', default=MOBILE_MODEL_PATH)
+    parser.add_argument('--data-dir', default=TEST_DIR)
+    parser.add_argument('--mode', choices=['batch', 'pool'], default='batch',
+                        help='batch: one interpreter with a resized input, pool: one interpreter per thread')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help='interpreter threads in batch mode')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='interpreters in pool mode')
+    args = parser.parse_args()
+
+    evaluate(args.model, args.data_dir, args.mode, args.batch_size, args.threads, args.workers)
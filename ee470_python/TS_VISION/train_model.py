@@ -7,6 +7,52 @@ import numpy as np
 import random
 from collections import Counter
 from data_nn import TrafficSignClassifier, train_model, device, model, criterion, optimizer 
+from samplers import IndexedDataset, HardExampleSampler, class_balanced_sampler
+
+BATCH_SIZE = 64
+NUM_EPOCHS = 10
+
+CLEAN_ANNOTATION_NAME = '_annotations.clean.txt'
+
+
+def annotation_file_for(split_dir):
+    """Cleaned manifest written by preflight.py if it exists, the raw annotations otherwise."""
+    clean_file = os.path.join(split_dir, CLEAN_ANNOTATION_NAME)
+    if os.path.exists(clean_file):
+        return clean_file
+    return os.path.join(split_dir, '_annotations.txt')
+
+
+def parse_annotation_line(line):
+    """
+    Parse one annotation line into (img_name, class_id).
+    Returns None for lines without an image, raises ValueError for malformed labels.
+    """
+    if line.startswith("Error: "):
+        line = line[7:].strip()
+    
+    main_parts = line.strip().split('.jpg ') #edit label
+
+    if len(main_parts) < 2: 
+        return None #skip 
+
+    #reconstruct the image filename and labels
+    img_path_raw = main_parts[0] + '.jpg'
+    labels_raw = main_parts[1].strip() 
+    label_parts = labels_raw.split(',')
+    
+    if len(label_parts) < 5:
+        raise ValueError(f"Annotation format error: {line.strip()}")
+    
+    try:
+        # ID CHECK
+        class_id = int(label_parts[-1]) 
+        img_name = os.path.basename(img_path_raw)
+    except (ValueError, IndexError):
+        raise ValueError(f"Could not parse class ID or image name from {line.strip()}")
+
+    return img_name, class_id
+
 
 #dataloader
 class AnnotationDataset(Dataset):
@@ -19,35 +65,20 @@ class AnnotationDataset(Dataset):
 
         with open(annotation_file, 'r') as f: #use annotation file
             for line in f:
-                
-                if line.startswith("Error: "):
-                    line = line[7:].strip()
-                
-                main_parts = line.strip().split('.jpg ') #edit label
-
-                if len(main_parts) < 2: 
-                    continue #skip 
-
-                #reconstruct the image filename and labels
-                img_path_raw = main_parts[0] + '.jpg'
-                labels_raw = main_parts[1].strip() 
-                label_parts = labels_raw.split(',')
-                
-                if len(label_parts) < 5:
-                     print(f"Warning: Annotation format error: {line.strip()}")
-                     continue
-                
                 try:
-                    # ID CHECK
-                    class_id = int(label_parts[-1]) 
-                    img_name = os.path.basename(img_path_raw)
-                    self.data_entries.append((img_name, class_id))
-                    class_ids.append(class_id)
-                    
-                except (ValueError, IndexError):
-                    print(f"Error: Could not parse class ID or image name from {line.strip()}")
+                    entry = parse_annotation_line(line)
+                except ValueError as e:
+                    print(f"Warning: {e}")
                     continue #skip
 
+                if entry is None:
+                    continue #skip
+
+                self.data_entries.append(entry)
+                class_ids.append(entry[1])
+
+        self.class_ids = class_ids
+
         # Find number of classes
         if class_ids:
             self.num_classes = max(class_ids) + 1
@@ -65,8 +96,8 @@ class AnnotationDataset(Dataset):
         try:
             image = Image.open(img_path).convert('RGB')
         except FileNotFoundError:
-            print(f"Error. Images has no. {img_path}.")
-            return None
+            # fail here with the path instead of a None blowing up in collation, run preflight.py first
+            raise FileNotFoundError(f"Error. Images has no. {img_path}. Run preflight.py to build a clean manifest.")
 
         if self.transform:
             image_tensor = self.transform(image)
@@ -82,11 +113,17 @@ class AnnotationDataset(Dataset):
 if __name__ == '__main__':
     
     DATA_DIR_PATH = './dataset/' 
-    ANNOTATION_FILE = os.path.join(DATA_DIR_PATH, 'train', '_annotations.txt')
+    ANNOTATION_FILE = annotation_file_for(os.path.join(DATA_DIR_PATH, 'train'))
     TRAIN_IMG_DIR = os.path.join(DATA_DIR_PATH, 'train') 
+    VALID_IMG_DIR = os.path.join(DATA_DIR_PATH, 'valid')
+
+    SEED = 42
+    SAMPLING = 'uniform'  # 'uniform', 'balanced' (class-balanced) or 'hard' (class-balanced + hard-example mining)
+    TARGET_ACCURACY = None  # e.g. 95.0 -> stop once validation accuracy reaches it
 
-    BATCH_SIZE = 64
-    NUM_EPOCHS = 10 
+    random.seed(SEED)
+    np.random.seed(SEED)
+    torch.manual_seed(SEED)
     
     # preprocessing
     train_transform = transforms.Compose([
@@ -112,9 +149,30 @@ if __name__ == '__main__':
         print(f"Please update NUM_CLASSES in data_nn.py to {DATASET_NUM_CLASSES} and restart.")
         exit()
 
-    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
+    # class histogram, the classes are imbalanced
+    class_counts = Counter(train_dataset.class_ids)
+    print(f"Class counts: min {min(class_counts.values())}, max {max(class_counts.values())}, classes {len(class_counts)}")
+
+    sampler = None
+    if SAMPLING == 'balanced':
+        sampler = class_balanced_sampler(train_dataset.class_ids, DATASET_NUM_CLASSES)
+    elif SAMPLING == 'hard':
+        sampler = HardExampleSampler(train_dataset.class_ids, DATASET_NUM_CLASSES)
+        train_dataset = IndexedDataset(train_dataset)
+
+    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=sampler is None, sampler=sampler)
+
+    # validation split, only needed for the early stop
+    valid_dataloader = None
+    if TARGET_ACCURACY is not None:
+        valid_dataset = AnnotationDataset(
+            annotation_file=annotation_file_for(VALID_IMG_DIR),
+            img_dir=VALID_IMG_DIR,
+            transform=train_transform
+        )
+        valid_dataloader = DataLoader(valid_dataset, batch_size=BATCH_SIZE, shuffle=False)
     
-    print(f"Train is started")
+    print(f"Train is started (sampling: {SAMPLING})")
     
     # train
     train_model(
@@ -122,7 +180,10 @@ if __name__ == '__main__':
         dataloader=train_dataloader, 
         criterion=criterion, 
         optimizer=optimizer, 
-        num_epochs=NUM_EPOCHS
+        num_epochs=NUM_EPOCHS,
+        sampler=sampler,
+        target_accuracy=TARGET_ACCURACY,
+        valid_dataloader=valid_dataloader
     )
 
     # save